@@ -1,19 +1,97 @@
+import contextlib
 import datetime
+import functools
+import os
 import re
 import logging
 from decimal import Decimal
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Dict, Iterator, List, Literal, Optional, Sequence, Tuple
 
 import pypdf
+import pypdfium2
 from beancount.core import data
 from beancount.core.amount import Amount
 from beancount.core.number import D
-from beangulp import extract, similar, utils
+from beangulp import utils
 from beangulp.importer import Importer
 
-
-class PDFStatementImporter(Importer):
+from .common import DeduplicationMixin
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+try:
+    import re2  # google-re2, linear-time matching
+except ImportError:
+    re2 = None
+
+PDFBackend = Literal["pymupdf", "pypdfium2", "pypdf"]
+
+# Number of files whose extracted page text is kept between identify and extract
+_TEXT_CACHE_SIZE = 32
+
+# Files smaller than this (in bytes) can't be a bank statement
+_MIN_PDF_SIZE = 1024
+
+# Norwegian bank statement indicators, checked against the first page
+_NORWEGIAN_PATTERNS = tuple(re.compile(p) for p in [
+    r"Kontoutskrift",
+    r"Saldo.*favør",
+    r"perioden\s+\d{2}\.\d{2}\.\d{4}\s+-\s+\d{2}\.\d{2}\.\d{4}",
+])
+
+_PERIOD_RE = re.compile(r'perioden\s+\d{2}\.\d{2}\.\d{4}\s+-\s+(\d{2}\.\d{2}\.\d{4})')
+
+# Length of "perioden DD.MM.YYYY - DD.MM.YYYY"
+_PERIOD_LENGTH = 32
+
+# Balance patterns as a single alternation, so the text is scanned only once.
+# The generic "Saldo ... <number>" fallback goes last. When google-re2 is
+# installed it is used instead of `re`, bounding the scan to linear time
+# regardless of what the extracted PDF text looks like. RE2's \s and \d are
+# ASCII-only, so whitespace (including the no-break spaces PDF extraction
+# tends to produce) is spelled out and `re` is compiled with re.ASCII, making
+# both engines match the same text.
+_WS = r'[ \t\r\n\f\xa0]'
+_BALANCE_PATTERN = (
+    rf'(?:SaldoiDeresfavør{_WS}*([\d.,]+)'
+    rf'|Saldo{_WS}+i{_WS}+Deres{_WS}+favør{_WS}*([\d.,]+)'
+    rf'|Saldo{_WS}+kr{_WS}*([\d.,]+)'
+    r'|Saldo.*?(\d[\d.,]+))'
+)
+_BALANCE_RE = re2.compile(_BALANCE_PATTERN) if re2 else re.compile(_BALANCE_PATTERN, re.ASCII)
+
+
+def _is_norwegian_date(value: str) -> bool:
+    """Check whether a string has the DD.MM.YYYY shape, without parsing it."""
+    return (
+        len(value) == 10
+        and value[2] == value[5] == "."
+        and value.isascii()
+        and (value[:2] + value[3:5] + value[6:]).isdigit()
+    )
+
+
+def _pdfium_page_text(pdf: pypdfium2.PdfDocument, index: int) -> str:
+    """Extract the text of a single page using PDFium."""
+    page = pdf[index]
+    textpage = page.get_textpage()
+    try:
+        return textpage.get_text_range()
+    finally:
+        textpage.close()
+        page.close()
+
+
+def _pymupdf_page_text(doc: "pymupdf.Document", index: int) -> str:
+    """Extract the text of a single page using PyMuPDF."""
+    return doc[index].get_text("text")
+
+
+class PDFStatementImporter(DeduplicationMixin, Importer):
     """
     Importer for SpareBank 1 PDF bank statements.
     This importer processes PDF statements from SpareBank 1 in Norway,
@@ -23,6 +101,9 @@ class PDFStatementImporter(Importer):
     checks balances at the beginning of the specified day.
     """
 
+    # Default PDF text extraction backend, see PDFBackend
+    backend: PDFBackend = "pypdfium2"
+
     def __init__(
         self,
         account_name: str,
@@ -32,6 +113,7 @@ class PDFStatementImporter(Importer):
         dedup_max_date_delta: int = 2,
         dedup_epsilon: Decimal = Decimal("0.05"),
         flag: str = "*",
+        pdf_backend: Optional[PDFBackend] = None,
     ):
         """
         Initialize a PDF statement importer.
@@ -44,17 +126,28 @@ class PDFStatementImporter(Importer):
             dedup_window_days: Days to look back for duplicates.
             dedup_max_date_delta: Max days difference for duplicate detection.
             dedup_epsilon: Tolerance for amount differences in duplicates.
+            pdf_backend: Library used for PDF text extraction: "pymupdf",
+                "pypdfium2" or "pypdf" (default: the `backend` class attribute).
+                "pymupdf" requires the optional PyMuPDF package.
         """
+        if pdf_backend is not None:
+            self.backend = pdf_backend
+        if self.backend not in ("pymupdf", "pypdfium2", "pypdf"):
+            raise ValueError(f"Unknown PDF backend: {self.backend!r}")
+        if self.backend == "pymupdf" and pymupdf is None:
+            raise ImportError("The pymupdf PDF backend requires PyMuPDF to be installed")
+
         self.account_name = account_name
         self.currency = currency
         self.prefix = prefix
         self.flag = flag
 
-        self.dedup_window = datetime.timedelta(days=dedup_window_days)
-        self.dedup_max_date_delta = datetime.timedelta(days=dedup_max_date_delta)
-        self.dedup_epsilon = dedup_epsilon
+        self._init_deduplication(dedup_window_days, dedup_max_date_delta, dedup_epsilon)
         self.logger = logging.getLogger('PDFStatementImporter')
 
+        # Extracted page text keyed by (filepath, mtime), then page index
+        self._text_cache: Dict[Tuple[str, float], Dict[int, str]] = {}
+
     def identify(self, filepath: str) -> bool:
         """
         Identify if the file is a Norwegian bank PDF statement.
@@ -69,20 +162,18 @@ class PDFStatementImporter(Importer):
         if not utils.is_mimetype(path, "application/pdf"):
             return False
 
-        # Check for Norwegian bank statement indicators
-        norwegian_patterns = [
-            r"Kontoutskrift",
-            r"Saldo.*favør",
-            r"perioden\s+\d{2}\.\d{2}\.\d{4}\s+-\s+\d{2}\.\d{2}\.\d{4}"
-        ]
-
         try:
-            with path.open('rb') as f:
-                pdf = pypdf.PdfReader(f)
-                return len(pdf.pages) > 0 and any(
-                    re.search(pattern, pdf.pages[0].extract_text())
-                    for pattern in norwegian_patterns
-                )
+            # Skip parsing files too small to be a real statement
+            if os.path.getsize(filepath) < _MIN_PDF_SIZE:
+                return False
+
+            with self._cached_pages(filepath) as pages:
+                if len(pages) == 0:
+                    return False
+
+                # Extract the first page once, not once per pattern
+                text = pages[0]()
+                return any(pattern.search(text) for pattern in _NORWEGIAN_PATTERNS)
         except Exception as e:
             self.logger.debug(f"Error identifying file {filepath}: {str(e)}")
             return False
@@ -122,21 +213,11 @@ class PDFStatementImporter(Importer):
 
         try:
             # Extract text from the full PDF
-            with open(filepath, 'rb') as f:
-                pdf = pypdf.PdfReader(f)
-                if len(pdf.pages) == 0:
+            with self._cached_pages(filepath) as pages:
+                if len(pages) == 0:
                     return entries
 
-                # Get text from all pages to ensure we find the final balance
-                full_text = ""
-                for page in pdf.pages:
-                    full_text += page.extract_text() + "\n"
-
-                # Extract end date (last date if multiple found)
-                end_date = self._extract_end_date(full_text)
-
-                # Extract balance (last balance if multiple found)
-                balance = self._extract_final_balance(full_text)
+                end_date, balance = self._extract_statement_info(pages)
 
                 if end_date and balance:
                     # Set balance date to the day AFTER the statement end date
@@ -176,22 +257,114 @@ class PDFStatementImporter(Importer):
             self.logger.error(f"Error extracting data from {filepath}: {str(e)}")
             return entries
 
-    def deduplicate(
-        self, entries: List[data.Directive], existing: List[data.Directive]
-    ) -> None:
+    @contextlib.contextmanager
+    def _open_pages(self, filepath: str) -> Iterator[List[Callable[[], str]]]:
         """
-        Mark duplicate entries based on configurable parameters.
+        Open a PDF with the configured backend.
 
         Args:
-            entries: List of new entries to check for duplicates.
-            existing: List of existing entries to compare against.
+            filepath: Path to the PDF file.
+
+        Yields:
+            One callable per page, returning the text of that page. Text is
+            only extracted when the callable is invoked.
         """
-        comparator = similar.heuristic_comparator(
-            max_date_delta=self.dedup_max_date_delta,
-            epsilon=self.dedup_epsilon,
-        )
+        if self.backend == "pymupdf":
+            doc = pymupdf.open(filepath)
+            try:
+                yield [functools.partial(_pymupdf_page_text, doc, i) for i in range(len(doc))]
+            finally:
+                doc.close()
+        elif self.backend == "pypdfium2":
+            pdf = pypdfium2.PdfDocument(filepath)
+            try:
+                yield [functools.partial(_pdfium_page_text, pdf, i) for i in range(len(pdf))]
+            finally:
+                pdf.close()
+        else:
+            with open(filepath, 'rb') as f:
+                pdf = pypdf.PdfReader(f, strict=False)
+                yield [page.extract_text for page in pdf.pages]
+
+    @contextlib.contextmanager
+    def _cached_pages(self, filepath: str) -> Iterator[List[Callable[[], str]]]:
+        """
+        Open a PDF like `_open_pages`, reusing page text extracted earlier.
 
-        extract.mark_duplicate_entries(entries, existing, self.dedup_window, comparator)
+        beangulp calls identify and then extract on the same file, and text
+        extraction is by far the most expensive step. Extracted text is cached
+        per file and modification time, so a changed file is read again.
+
+        Args:
+            filepath: Path to the PDF file.
+
+        Yields:
+            One callable per page, returning the (possibly cached) page text.
+        """
+        key = (filepath, os.path.getmtime(filepath))
+        texts = self._text_cache.get(key)
+        if texts is None:
+            if len(self._text_cache) >= _TEXT_CACHE_SIZE:
+                # Evict the oldest entry, dicts keep insertion order
+                del self._text_cache[next(iter(self._text_cache))]
+            texts = self._text_cache[key] = {}
+
+        def cached(index: int, page_text: Callable[[], str]) -> str:
+            if index not in texts:
+                texts[index] = page_text()
+            return texts[index]
+
+        with self._open_pages(filepath) as pages:
+            yield [functools.partial(cached, i, page_text) for i, page_text in enumerate(pages)]
+
+    def _extract_statement_info(
+        self, pages: Sequence[Callable[[], str]]
+    ) -> Tuple[Optional[datetime.date], Optional[str]]:
+        """
+        Extract the statement end date and final balance from the PDF pages.
+
+        Pages are extracted one at a time starting from the last page, since
+        text extraction is the dominant cost and the final balance is found
+        near the end of the statement. The balance is taken from the last page
+        that has one, so an opening balance on an earlier page never wins.
+        Scanning continues towards the first page only while the end date is
+        still missing. If either value is not found on any single page, the
+        text of all pages is joined and searched as a whole.
+
+        Args:
+            pages: Per-page text extractors, as yielded by `_open_pages`.
+
+        Returns:
+            A tuple of the end date and the final balance, either of which
+            may be None if not found.
+        """
+        end_date = None
+        balance = None
+        texts = []
+        for page_text in reversed(pages):
+            text = page_text()
+            texts.append(text)
+
+            page_date = self._extract_end_date(text)
+            if page_date and (end_date is None or page_date > end_date):
+                end_date = page_date
+            if balance is None:
+                balance = self._extract_final_balance(text)
+            if end_date and balance:
+                return end_date, balance
+
+        # Fall back to searching the full text, restored to document order
+        full_text = "\n".join(reversed(texts))
+
+        # Extract end date (last date if multiple found)
+        if end_date is None:
+            end_date = self._extract_end_date(full_text)
+
+        # Extract balance (last balance if multiple found)
+        if balance is None:
+            balance = self._extract_final_balance(full_text)
+
+        return end_date, balance
 
     def _extract_end_date(self, text: str) -> Optional[datetime.date]:
         """
@@ -203,13 +376,29 @@ class PDFStatementImporter(Importer):
         Returns:
             The latest end date as a datetime.date object or None if not found.
         """
-        # Find all period matches
-        period_matches = re.finditer(r'perioden\s+\d{2}\.\d{2}\.\d{4}\s+-\s+(\d{2}\.\d{2}\.\d{4})', text)
-
         latest_date = None
 
-        for match in period_matches:
-            date_str = match.group(1)
+        start = text.find("perioden")
+        while start != -1:
+            # Fast path for the usual "perioden DD.MM.YYYY - DD.MM.YYYY" layout,
+            # falling back to the regex when the spacing differs
+            period = text[start:start + _PERIOD_LENGTH]
+            if (
+                period[8:9] == " "
+                and period[19:22] == " - "
+                and _is_norwegian_date(period[9:19])
+                and _is_norwegian_date(period[22:32])
+            ):
+                date_str = period[22:32]
+                end = start + _PERIOD_LENGTH
+            else:
+                match = _PERIOD_RE.match(text, start)
+                if match is None:
+                    start = text.find("perioden", start + 1)
+                    continue
+                date_str = match.group(1)
+                end = match.end()
+
             try:
                 # Parse Norwegian date format (DD.MM.YYYY)
                 day, month, year = map(int, date_str.split('.'))
@@ -220,6 +409,8 @@ class PDFStatementImporter(Importer):
             except Exception as e:
                 self.logger.debug(f"Error parsing date '{date_str}': {str(e)}")
 
+            start = text.find("perioden", end)
+
         return latest_date
 
     def _extract_final_balance(self, text: str) -> Optional[str]:
@@ -232,26 +423,16 @@ class PDFStatementImporter(Importer):
         Returns:
             The final balance as a string or None if not found.
         """
-        # Try different balance patterns
-        balance_patterns = [
-            r'SaldoiDeresfavør\s*([\d.,]+)',
-            r'Saldo\s+i\s+Deres\s+favør\s*([\d.,]+)',
-            r'Saldo.*?(\d[\d.,]+)',
-            r'Saldo\s+kr\s*([\d.,]+)'
-        ]
-
-        # Find all balance matches
-        all_balances = []
-
-        for pattern in balance_patterns:
-            matches = re.finditer(pattern, text)
-            for match in matches:
-                # Handle Norwegian number format (replace comma with period)
-                balance = match.group(1).replace('.', '').replace(',', '.')
-                all_balances.append(balance)
-
-        # Return the last balance found (most likely the final balance)
-        if all_balances:
-            return all_balances[-1]
-
-        return None
+        # Keep only the last balance match (most likely the final balance)
+        last = None
+        for match in _BALANCE_RE.finditer(text):
+            last = match
+
+        if last is None:
+            return None
+
+        # Only one alternative participates in a match
+        value = next(group for group in last.groups() if group is not None)
+
+        # Handle Norwegian number format (replace comma with period)
+        return value.replace('.', '').replace(',', '.')
@@ -0,0 +1,109 @@
+import bisect
+import datetime
+import functools
+import operator
+from decimal import Decimal
+from typing import Callable, List, Optional, Set
+
+from beancount.core import data
+from beangulp import extract, similar
+
+
+@functools.lru_cache(maxsize=16)
+def get_comparator(max_date_delta: int, epsilon: str) -> Callable[[data.Directive, data.Directive], bool]:
+    """
+    Return a heuristic duplicate comparator, shared between importers.
+
+    Users typically set up several importers with the same dedup parameters,
+    so they can all share one comparator.
+
+    Args:
+        max_date_delta: Max days difference for duplicate detection.
+        epsilon: Tolerance for amount differences, as a decimal string.
+
+    Returns:
+        The comparator function.
+    """
+    return similar.heuristic_comparator(
+        max_date_delta=datetime.timedelta(days=max_date_delta),
+        epsilon=Decimal(epsilon),
+    )
+
+
+_by_date = operator.attrgetter("date")
+
+
+def _accounts_of(entry: data.Directive) -> Set[str]:
+    """Return the accounts an entry refers to, through its postings or account."""
+    postings = getattr(entry, "postings", None)
+    if postings:
+        return {posting.account for posting in postings}
+    account = getattr(entry, "account", None)
+    return {account} if account else set()
+
+
+class DeduplicationMixin:
+    """
+    Shared duplicate detection for the importers in this package.
+
+    Importers call `_init_deduplication` from their constructor and inherit
+    `deduplicate`, which beangulp uses to mark already imported entries.
+    """
+
+    def _init_deduplication(
+        self, window_days: int, max_date_delta: int, epsilon: Decimal
+    ) -> None:
+        """
+        Configure duplicate detection.
+
+        Args:
+            window_days: Days to look back for duplicates.
+            max_date_delta: Max days difference for duplicate detection.
+            epsilon: Tolerance for amount differences in duplicates.
+        """
+        self.dedup_window = datetime.timedelta(days=window_days)
+        self.dedup_max_date_delta = datetime.timedelta(days=max_date_delta)
+        self.dedup_epsilon = epsilon
+        self._comparator = get_comparator(max_date_delta, str(epsilon))
+
+    def deduplicate(
+        self, entries: List[data.Directive], existing: List[data.Directive]
+    ) -> None:
+        """
+        Mark duplicate entries based on configurable parameters.
+
+        Args:
+            entries: List of new entries to check for duplicates.
+            existing: List of existing entries to compare against.
+        """
+        if not entries or not existing:
+            return
+
+        # Narrow the existing entries down to those that could possibly be
+        # duplicates before running the pairwise comparison: they must fall
+        # within the window around the new entries and share an account with
+        # one of them, as the heuristic comparator requires common accounts.
+        accounts: Optional[Set[str]] = set()
+        for entry in entries:
+            entry_accounts = _accounts_of(entry)
+            if not entry_accounts:
+                # Nothing to narrow down on for this entry, keep all accounts
+                accounts = None
+                break
+            accounts |= entry_accounts
+
+        # Ledger entries normally arrive sorted by date, in which case sorting
+        # is a single linear pass. The window is then found by bisection
+        # rather than by testing every existing entry's date.
+        existing = sorted(existing, key=_by_date)
+        date_min = min(entry.date for entry in entries) - self.dedup_window
+        date_max = max(entry.date for entry in entries) + self.dedup_window
+        lo = bisect.bisect_left(existing, date_min, key=_by_date)
+        hi = bisect.bisect_right(existing, date_max, lo=lo, key=_by_date)
+
+        candidates = [
+            entry for entry in existing[lo:hi]
+            if accounts is None or not accounts.isdisjoint(_accounts_of(entry))
+        ]
+
+        extract.mark_duplicate_entries(entries, candidates, self.dedup_window, self._comparator)
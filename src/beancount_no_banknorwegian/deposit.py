@@ -1,22 +1,156 @@
+import codecs
 import csv
 import datetime
+import functools
+import os
+import re
+import sys
 from decimal import Decimal
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
 from beancount.core import data
 from beancount.core.amount import Amount as BeanAmount
-from beangulp import extract, similar, utils
+from beangulp import utils
 from beangulp.importers.csvbase import Column, CreditOrDebit, Date, Importer, Amount
 
 from beangulp.testing import main as test_main
 
+from .common import DeduplicationMixin
+
+try:
+    import ahocorasick  # pyahocorasick
+except ImportError:
+    ahocorasick = None
+
 DIALECT_NAME = "banknorwegian"
 
 csv.register_dialect(DIALECT_NAME, delimiter=",")
 
+# Decimal comma to point, and drop (non-breaking) space thousands separators
+_AMOUNT_TRANS = str.maketrans({",": ".", " ": None, "\xa0": None})
+
+# Default balancing accounts by transaction type, used when no mapping matches.
+# Purchases ("Kjøp") and other types go to "Expenses:Uncategorized".
+_TYPE_DEFAULT_ACCOUNTS = {
+    "Innbetaling": "Income:Unknown",  # Deposit
+    "CreditVoucher": "Expenses:Refunds",  # Refunds usually go to expenses accounts
+}
+
+HEADER = "TransactionDate,Text,Type,Currency Amount,Currency Rate,Currency,Amount,Merchant Area,Merchant Category,BookDate,ValueDate"
+_HEADER_BYTES = HEADER.encode("utf-8")
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_day_first_date(value: str, separator: str) -> datetime.date:
+    """Parse a day-first date, memoized as statements repeat the same dates."""
+    day, month, year = value.strip().split(separator)
+    return datetime.date(int(year), int(month), int(day))
+
+
+class _DayFirstDate(Date):
+    """
+    Date column for day-first dates such as "1/2/2022" or "01/02/2022".
+
+    Splitting on the separator is several times faster than strptime, which
+    matters as the column is parsed for every CSV row.
+    """
+
+    def __init__(self, name: str, separator: str = "/"):
+        super().__init__(name, f"%d{separator}%m{separator}%Y")
+        self.separator = separator
+
+    def parse(self, value: str) -> datetime.date:
+        return _parse_day_first_date(value, self.separator)
+
+
+class _NokAmount(Amount):
+    """
+    Amount column accepting either "." or "," as the decimal separator.
+
+    Spaces used as thousands separators are dropped. All cleanup happens in a
+    single str.translate pass instead of the regex substitutions csvbase runs
+    for `subs`.
+    """
+
+    def parse(self, value: str) -> Decimal:
+        return Decimal(value.translate(_AMOUNT_TRANS))
+
 
-class DepositAccountImporter(Importer):
+def _intern_mappings(
+    mappings: Optional[Sequence[Tuple[str, str]]]
+) -> List[Tuple[str, str]]:
+    """
+    Intern the patterns and accounts of (pattern, account) mappings.
+
+    Every posting to a mapped account then shares one string object, which
+    lets Beancount's account dicts and sets compare keys by identity.
+    """
+    return [(sys.intern(pattern), sys.intern(account)) for pattern, account in mappings or []]
+
+
+class _AccountMatcher:
+    """
+    Match text against a list of (pattern, account) mappings in a single pass.
+
+    Patterns are literal substrings. When several patterns occur in the text,
+    the one listed first wins, the same as checking each pattern in order.
+    An Aho-Corasick automaton is used when pyahocorasick is installed, which
+    keeps matching linear in the text length however many patterns there are.
+    Otherwise the patterns are compiled into one regex alternation.
+    """
+
+    def __init__(self, mappings: Sequence[Tuple[str, str]]):
+        self.accounts = [account for _, account in mappings]
+        self.automaton = None
+        self.regex = None
+
+        if not mappings:
+            return
+
+        # The automaton can't hold empty patterns, which match everything
+        if ahocorasick is not None and all(pattern for pattern, _ in mappings):
+            self.automaton = ahocorasick.Automaton()
+            for index, (pattern, _) in enumerate(mappings):
+                # Keep the first mapping of a repeated pattern
+                if pattern not in self.automaton:
+                    self.automaton.add_word(pattern, index)
+            self.automaton.make_automaton()
+        else:
+            # Zero-width lookaheads report a match at every position where some
+            # pattern starts, so overlapping occurrences aren't skipped.
+            self.regex = re.compile(
+                "(?=" + "|".join(f"({re.escape(pattern)})" for pattern, _ in mappings) + ")"
+            )
+
+    def match(self, text: str) -> Optional[str]:
+        """
+        Find the account of the first mapping whose pattern occurs in the text.
+
+        Args:
+            text: The text to search, e.g. the transaction narration.
+
+        Returns:
+            The mapped account, or None if no pattern occurs in the text.
+        """
+        if self.automaton is not None:
+            indices = (index for _, index in self.automaton.iter(text))
+        elif self.regex is not None:
+            indices = (m.lastindex - 1 for m in self.regex.finditer(text))
+        else:
+            return None
+
+        best = None
+        for index in indices:
+            if best is None or index < best:
+                best = index
+                if best == 0:
+                    break
+
+        return None if best is None else self.accounts[best]
+
+
+class DepositAccountImporter(DeduplicationMixin, Importer):
     """
     Importer for Bank Norwegian deposit account CSV statements.
 
@@ -33,17 +167,13 @@ class DepositAccountImporter(Importer):
     names = True
 
     # Configure column mappings
-    date = Date("TransactionDate", "%d/%m/%Y")  # Norwegian date format
+    date = _DayFirstDate("TransactionDate")  # Norwegian date format
     narration = Column("Text")
 
     # Type indicates transaction type (Kjøp, Innbetaling, CreditVoucher, etc.)
     type = Column("Type")
 
-    amount = Amount("Amount",
-        subs={
-            ",": "."   # Convert decimal separator if needed
-        }
-    )
+    amount = _NokAmount("Amount")  # Converts decimal separator if needed
 
     # Additional metadata fields
     currency = Column("Currency")
@@ -82,12 +212,22 @@ class DepositAccountImporter(Importer):
             dedup_epsilon: Tolerance for amount differences in duplicates.
         """
 
-        self.narration_to_account_mappings = narration_to_account_mappings or []
-        self.from_account_mappings = from_account_mappings or []
-        self.to_account_mappings = to_account_mappings or []
-        self.dedup_window = datetime.timedelta(days=dedup_window_days)
-        self.dedup_max_date_delta = datetime.timedelta(days=dedup_max_date_delta)
-        self.dedup_epsilon = dedup_epsilon
+        self.narration_to_account_mappings = _intern_mappings(narration_to_account_mappings)
+        self.from_account_mappings = _intern_mappings(from_account_mappings)
+        self.to_account_mappings = _intern_mappings(to_account_mappings)
+        self._narration_matcher = _AccountMatcher(self.narration_to_account_mappings)
+        self._from_account_matcher = _AccountMatcher(self.from_account_mappings)
+
+        # Recurring narrations (subscriptions, transfers, ...) resolve to the
+        # same account, so remember the result per narration and type
+        self._resolve_account = functools.lru_cache(maxsize=4096)(
+            self._resolve_account_uncached
+        )
+
+        # Rows of the last file read, keyed by (filepath, mtime)
+        self._rows_key: Optional[Tuple[str, float]] = None
+        self._rows: List[Any] = []
+        self._init_deduplication(dedup_window_days, dedup_max_date_delta, dedup_epsilon)
         super().__init__(account_name, currency, flag=flag)
 
     def identify(self, filepath: str) -> bool:
@@ -103,11 +243,16 @@ class DepositAccountImporter(Importer):
 
         if not utils.is_mimetype(filepath, "text/csv"):
             return False
-        return utils.search_file_regexp(
-            filepath,
-            "TransactionDate,Text,Type,Currency Amount,Currency Rate,Currency,Amount,Merchant Area,Merchant Category,BookDate,ValueDate",
-            encoding=self.encoding,
-        )
+
+        # The header is always at the start of the file, so read just enough
+        # bytes to compare it, allowing for a byte order mark. A single
+        # unbuffered read is all that's needed, so skip the file object.
+        fd = os.open(filepath, os.O_RDONLY)
+        try:
+            head = os.read(fd, len(codecs.BOM_UTF8) + len(_HEADER_BYTES))
+        finally:
+            os.close(fd)
+        return head.removeprefix(codecs.BOM_UTF8).startswith(_HEADER_BYTES)
 
     def filename(self, filepath: str) -> str:
         """
@@ -121,23 +266,26 @@ class DepositAccountImporter(Importer):
         """
         return f"banknorwegian.{Path(filepath).name}"
 
-    def deduplicate(
-        self, entries: List[data.Directive], existing: List[data.Directive]
-    ) -> None:
+    def read(self, filepath: str) -> Iterator[Any]:
         """
-        Mark duplicate entries based on configurable parameters.
+        Read the rows of a CSV file, reusing the rows of the last file read.
 
-        Args:
-            entries: List of new entries to check for duplicates.
-            existing: List of existing entries to compare against.
-        """
+        beangulp may call both date() and extract() on a file, and both read
+        every row. The rows of the most recently read file are kept until it's
+        modified, so the CSV is only tokenized once. Rows hold the raw field
+        strings, and each column is still parsed when it's accessed.
 
-        comparator = similar.heuristic_comparator(
-            max_date_delta=self.dedup_max_date_delta,
-            epsilon=self.dedup_epsilon,
-        )
+        Args:
+            filepath: Path to the CSV file.
 
-        extract.mark_duplicate_entries(entries, existing, self.dedup_window, comparator)
+        Returns:
+            An iterator over the parsed rows.
+        """
+        key = (filepath, os.path.getmtime(filepath))
+        if key != self._rows_key:
+            self._rows = list(super().read(filepath))
+            self._rows_key = key
+        return iter(self._rows)
 
     def metadata(self, filepath: str, lineno: int, row: Any) -> Dict[str, Any]:
         """
@@ -154,16 +302,20 @@ class DepositAccountImporter(Importer):
 
         meta = super().metadata(filepath, lineno, row)
 
-        # Add additional metadata fields from the CSV
-        meta["type"] = getattr(row, "type", "")
-        meta["currency"] = getattr(row, "currency", "")
-        meta["merchant_area"] = getattr(row, "merchant_area", "")
-        meta["merchant_category"] = getattr(row, "merchant_category", "")
-        meta["book_date"] = getattr(row, "book_date", "")
-        meta["value_date"] = getattr(row, "value_date", "")
-
-        # Filter out empty values to keep metadata clean
-        return {k: v for k, v in meta.items() if v != ""}
+        # Add additional metadata fields from the CSV, skipping empty values
+        # to keep metadata clean
+        for key, value in (
+            ("type", row.type),
+            ("currency", row.currency),
+            ("merchant_area", row.merchant_area),
+            ("merchant_category", row.merchant_category),
+            ("book_date", row.book_date),
+            ("value_date", row.value_date),
+        ):
+            if value:
+                meta[key] = value
+
+        return meta
 
     def finalize(self, txn: data.Transaction, row: Any) -> Optional[data.Transaction]:
         """
@@ -190,53 +342,51 @@ class DepositAccountImporter(Importer):
         if not txn.postings:
             return txn  # No changes if no postings
 
-        # Get transaction type
-        transaction_type = getattr(row, "type", "")
+        account = self._resolve_account(txn.narration, row.type)
+        return self._append_balancing(txn, account)
+
+    def _resolve_account_uncached(self, narration: str, transaction_type: str) -> str:
+        """
+        Find the balancing account for a transaction.
+
+        Args:
+            narration: The transaction narration.
+            transaction_type: The transaction type from the CSV.
 
+        Returns:
+            The account to balance the transaction against.
+        """
         # Check narration patterns first (highest precedence)
-        for pattern, account in self.narration_to_account_mappings:
-            if pattern in txn.narration:
-                opposite_units = BeanAmount(-txn.postings[0].units.number, self.currency)
-                balancing_posting = data.Posting(
-                    account, opposite_units, None, None, None, None
-                )
-                return txn._replace(postings=txn.postings + [balancing_posting])
-
-        # Special handling for deposit ("Innbetaling") transactions
-        if transaction_type == "Innbetaling":
-            # Check from_account mappings for deposits
-            for pattern, account in self.from_account_mappings:
-                if pattern in txn.narration:
-                    opposite_units = BeanAmount(-txn.postings[0].units.number, self.currency)
-                    balancing_posting = data.Posting(
-                        account, opposite_units, None, None, None, None
-                    )
-                    return txn._replace(postings=txn.postings + [balancing_posting])
-
-            # Default deposit categorization if no mapping found
-            opposite_units = BeanAmount(-txn.postings[0].units.number, self.currency)
-            balancing_posting = data.Posting(
-                "Income:Unknown", opposite_units, None, None, None, None
-            )
-            return txn._replace(postings=txn.postings + [balancing_posting])
-
-        # Special handling for refunds/credits ("CreditVoucher")
-        elif transaction_type == "CreditVoucher":
-            # Refunds usually go to expenses accounts
-            opposite_units = BeanAmount(-txn.postings[0].units.number, self.currency)
-            balancing_posting = data.Posting(
-                "Expenses:Refunds", opposite_units, None, None, None, None
-            )
-            return txn._replace(postings=txn.postings + [balancing_posting])
+        account = self._narration_matcher.match(narration)
+
+        # Deposits ("Innbetaling") are often from another account
+        if not account and transaction_type == "Innbetaling":
+            account = self._from_account_matcher.match(narration)
+
+        # Default categorization based on transaction type
+        if not account:
+            account = _TYPE_DEFAULT_ACCOUNTS.get(transaction_type, "Expenses:Uncategorized")
+
+        return account
+
+    def _append_balancing(self, txn: data.Transaction, account: str) -> data.Transaction:
+        """
+        Add a posting to the account that balances the transaction's first posting.
+
+        The transaction is built by csvbase for this row alone and not shared
+        yet, so its postings list is extended in place.
+
+        Args:
+            txn: The transaction to balance.
+            account: The account of the balancing posting.
+
+        Returns:
+            The transaction with the balancing posting appended.
+        """
+        units = BeanAmount(-txn.postings[0].units.number, self.currency)
+        txn.postings.append(data.Posting(account, units, None, None, None, None))
+        return txn
 
-        # Default for purchases ("Kjøp") and other types
-        else:
-            # Default to uncategorized expenses
-            opposite_units = BeanAmount(-txn.postings[0].units.number, self.currency)
-            balancing_posting = data.Posting(
-                "Expenses:Uncategorized", opposite_units, None, None, None, None
-            )
-            return txn._replace(postings=txn.postings + [balancing_posting])
 
 def main():
     """Entry point for the command-line interface."""
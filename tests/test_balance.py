@@ -0,0 +1,66 @@
+import datetime
+import re
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+from beancount_no_banknorwegian import balance
+from beancount_no_banknorwegian.balance import PDFStatementImporter
+
+TEST_DATA = Path(__file__).parent.parent / "test_data"
+
+
+@pytest.mark.parametrize("backend", [
+    "pypdf",
+    "pypdfium2",
+    pytest.param("pymupdf", marks=pytest.mark.skipif(
+        balance.pymupdf is None, reason="PyMuPDF is not installed")),
+])
+def test_final_balance_from_last_page(backend):
+    # Page 1 has the opening balance and period, page 2 the closing balance
+    filepath = str(TEST_DATA / "multipage_statement.pdf")
+    importer = PDFStatementImporter("Assets:Bank:BankNorwegian", pdf_backend=backend)
+
+    assert importer.identify(filepath)
+
+    [entry] = importer.extract(filepath)
+    assert entry.date == datetime.date(2024, 2, 1)
+    assert entry.amount.number == Decimal("9999.00")
+    assert entry.amount.currency == "NOK"
+
+
+def test_statement_info_stops_once_both_found():
+    importer = PDFStatementImporter("Assets:Bank:BankNorwegian")
+    extracted = []
+
+    def page(text):
+        def page_text():
+            extracted.append(text)
+            return text
+        return page_text
+
+    pages = [
+        page("unused"),
+        page("for perioden 01.01.2024 - 31.01.2024\nSaldo fra forrige kontoutskrift 1.000,00"),
+        page("Saldo i Deres favør 9.999,00"),
+    ]
+
+    assert importer._extract_statement_info(pages) == (datetime.date(2024, 1, 31), "9999.00")
+    assert "unused" not in extracted
+
+
+def _balance_engines():
+    yield pytest.param(re.compile(balance._BALANCE_PATTERN, re.ASCII), id="re")
+    if balance.re2 is not None:
+        yield pytest.param(balance.re2.compile(balance._BALANCE_PATTERN), id="re2")
+
+
+@pytest.mark.parametrize("engine", list(_balance_engines()))
+@pytest.mark.parametrize("text, groups", [
+    ("Saldo\xa0i\xa0Deres\xa0favør\xa09.999,00", (None, "9.999,00", None, None)),
+    ("Saldo kr\t12,00", (None, None, "12,00", None)),
+    ("Saldo x \u0661\u0662 3,00", (None, None, None, "3,00")),
+])
+def test_balance_regex_engines_agree(engine, text, groups):
+    assert engine.search(text).groups() == groups
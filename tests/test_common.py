@@ -0,0 +1,91 @@
+import datetime
+import random
+from decimal import Decimal
+
+import pytest
+from beancount.core import data
+from beancount.core.amount import Amount
+from beangulp import extract, similar
+
+from beancount_no_banknorwegian.common import DeduplicationMixin
+
+CHECKING = "Assets:Bank:BankNorwegian:Checking"
+GROCERIES = "Expenses:Groceries"
+TRANSPORT = "Expenses:Transportation"
+SAVINGS = "Assets:Bank:Other:Savings"
+SALARY = "Income:Salary"
+
+START = datetime.date(2024, 1, 1)
+
+
+class _Deduplicator(DeduplicationMixin):
+    def __init__(self):
+        self._init_deduplication(3, 2, Decimal("0.05"))
+
+
+def _transaction(date, postings):
+    return data.Transaction(
+        data.new_metadata("test", 0), date, "*", None, "narration",
+        data.EMPTY_SET, data.EMPTY_SET,
+        [data.Posting(account, Amount(number, "NOK"), None, None, None, None)
+         for account, number in postings],
+    )
+
+
+def _balance(date, account, number):
+    return data.Balance(data.new_metadata("test", 0), date, account, Amount(number, "NOK"), None, None)
+
+
+def _ledger(rng, accountless):
+    """Build a shuffled existing ledger and new entries, some duplicating it."""
+    amounts = [Decimal(n) for n in ("100.00", "102.00", "150.00", "23.78", "39.00")]
+    existing = []
+    for day in range(90):
+        date = START + datetime.timedelta(days=day)
+        number = rng.choice(amounts)
+        existing.append(_transaction(date, [(CHECKING, -number), (rng.choice([GROCERIES, TRANSPORT]), number)]))
+        # Same amounts, but no account in common with the new entries
+        existing.append(_transaction(date, [(SAVINGS, -number), (SALARY, number)]))
+        if day % 7 == 0:
+            existing.append(_balance(date, rng.choice([CHECKING, SAVINGS]), number))
+    rng.shuffle(existing)
+
+    entries = []
+    for _ in range(15):
+        date = START + datetime.timedelta(days=rng.randrange(30, 45))
+        number = rng.choice(amounts)
+        postings = [(CHECKING, -number), (GROCERIES, number)]
+        # A single posting is a subset of the accounts of a full transaction
+        entries.append(_transaction(date, postings[:rng.choice([1, 2])]))
+    entries.append(_balance(START + datetime.timedelta(days=35), CHECKING, Decimal("100.00")))
+    if accountless:
+        entries.append(_transaction(START + datetime.timedelta(days=40), []))
+    return entries, existing
+
+
+def _copy(entries):
+    return [entry._replace(meta=dict(entry.meta)) for entry in entries]
+
+
+@pytest.mark.parametrize("accountless", [False, True])
+@pytest.mark.parametrize("seed", range(10))
+def test_deduplicate_matches_beangulp(seed, accountless):
+    entries, existing = _ledger(random.Random(seed), accountless)
+    deduplicator = _Deduplicator()
+
+    expected = _copy(entries)
+    extract.mark_duplicate_entries(
+        expected,
+        list(existing),
+        deduplicator.dedup_window,
+        similar.heuristic_comparator(deduplicator.dedup_max_date_delta, deduplicator.dedup_epsilon),
+    )
+
+    actual = _copy(entries)
+    deduplicator.deduplicate(actual, list(existing))
+
+    marks = [entry.meta.get(extract.DUPLICATE) for entry in expected]
+    assert any(mark is not None for mark in marks)
+    assert any(mark is None for mark in marks)
+    for entry, mark in zip(actual, marks):
+        assert entry.meta.get(extract.DUPLICATE) is mark
@@ -0,0 +1,102 @@
+import importlib.util
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+from beancount.parser import printer
+from beangulp import extract
+
+from beancount_no_banknorwegian import deposit
+
+ROOT = Path(__file__).parent.parent
+TEST_DATA = ROOT / "test_data"
+
+
+def _quicktest_importer():
+    """Load the deposit importer `just test` generates the golden output with."""
+    spec = importlib.util.spec_from_file_location("quicktest", ROOT / "quicktest.py")
+    quicktest = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(quicktest)
+    return next(
+        importer for importer in quicktest.importers
+        if isinstance(importer, deposit.DepositAccountImporter)
+    )
+
+
+@pytest.fixture(params=["ahocorasick", "regex"])
+def matcher_engine(request, monkeypatch):
+    if request.param == "ahocorasick":
+        if deposit.ahocorasick is None:
+            pytest.skip("pyahocorasick is not installed")
+    else:
+        monkeypatch.setattr(deposit, "ahocorasick", None)
+    return request.param
+
+
+@pytest.mark.parametrize("mappings, text, expected", [
+    # Overlapping patterns
+    ([("ABCD", "Expenses:Long"), ("BC", "Expenses:Short")], "xABCDx", "Expenses:Long"),
+    ([("BC", "Expenses:Short"), ("ABCD", "Expenses:Long")], "xABCDx", "Expenses:Short"),
+    ([("AAB", "Expenses:A"), ("AA", "Expenses:B")], "AAAB", "Expenses:A"),
+    # A later pattern occurring earlier in the text
+    ([("GOLF", "Expenses:Golf"), ("HELLO", "Expenses:Hello")], "HELLO GOLFKLUBB", "Expenses:Golf"),
+    # Duplicate patterns
+    ([("RUTER", "Expenses:First"), ("RUTER", "Expenses:Second")], "Vipps*Ruter RUTER", "Expenses:First"),
+    ([("VIPPS", "Expenses:Vipps"), ("RUTER", "Expenses:First"), ("RUTER", "Expenses:Second")],
+     "RUTER", "Expenses:First"),
+    # An empty pattern matches any text
+    ([("SHOP", "Expenses:Shop"), ("", "Expenses:Other")], "HELLOSHOP.NO", "Expenses:Shop"),
+    ([("SHOP", "Expenses:Shop"), ("", "Expenses:Other")], "VOISCOOTERS", "Expenses:Other"),
+    ([("", "Expenses:Other"), ("SHOP", "Expenses:Shop")], "HELLOSHOP.NO", "Expenses:Other"),
+    # No match
+    ([("SHOP", "Expenses:Shop")], "VOISCOOTERS", None),
+    ([], "VOISCOOTERS", None),
+])
+def test_account_matcher_first_listed_wins(matcher_engine, mappings, text, expected):
+    matcher = deposit._AccountMatcher(mappings)
+
+    # The automaton can't hold empty patterns, so those always use the regex
+    uses_automaton = (
+        matcher_engine == "ahocorasick"
+        and bool(mappings)
+        and all(pattern for pattern, _ in mappings)
+    )
+    assert (matcher.automaton is not None) == uses_automaton
+
+    # Same result as checking each pattern in order
+    assert expected == next((account for pattern, account in mappings if pattern in text), None)
+    assert matcher.match(text) == expected
+
+
+def test_extract_matches_golden_output():
+    importer = _quicktest_importer()
+    filepath = str(TEST_DATA / "banknorwegian.csv")
+
+    assert importer.identify(filepath)
+
+    entries = extract.extract_from_file(importer, filepath, [])
+    output = extract.HEADER + "\n" + "\n".join(printer.format_entry(entry) for entry in entries)
+    assert output == (TEST_DATA / "banknorwegian_data.csv.beancount").read_text(encoding="utf-8")
+
+
+def test_read_reuses_rows_until_file_changes(tmp_path):
+    filepath = str(tmp_path / "banknorwegian.csv")
+    shutil.copy(TEST_DATA / "banknorwegian.csv", filepath)
+    importer = deposit.DepositAccountImporter("Assets:Bank:BankNorwegian:Checking")
+
+    rows = list(importer.read(filepath))
+    assert rows
+    assert all(a is b for a, b in zip(importer.read(filepath), rows, strict=True))
+
+    # Drop the last row and move the modification time forward
+    with open(filepath, encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(filepath, "w", encoding="utf-8") as f:
+        f.writelines(lines[:-1])
+    mtime = os.path.getmtime(filepath) + 10
+    os.utime(filepath, (mtime, mtime))
+
+    refreshed = list(importer.read(filepath))
+    assert len(refreshed) == len(rows) - 1
+    assert not any(a is b for a, b in zip(refreshed, rows))